@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+from pandas import DataFrame
+import numpy as np
+
+from Frames import Frame, load_offerframe
+
+# Keys which may be grouped upon without existing in the Frame, these are
+# derived from the yyyymmddpp Trading_Period_ID
+DERIVED_KEYS = {"Trading_Year": 1000000,
+                "Trading_Month": 10000,
+                "Trading_Day": 100}
+
+
+def aggregate_offers(fNames, by, values=("Price",), weights="Quantity",
+                     quantiles=None, bins=None, filters=None, processes=None,
+                     **kargs):
+    """ Aggregate offer data across many files without ever holding more
+    than a single file in memory at once.
+
+    Each file is loaded (through load_offerframe, or read directly if it is
+    a pickled Frame which has already been processed) and reduced to a
+    partial aggregate per group within a process pool. The partial states,
+    sums, counts, minimums, maximums and histograms, are mergeable and are
+    combined as each file completes, so memory is bounded by the number of
+    groups rather than the number of rows.
+
+    Example Usage:
+    --------------
+
+    # MW weighted average energy offer price by island, type and month
+    aggregate_offers(files, by=["Island_Name", "Generation_Type",
+                                "Trading_Month"],
+                     filters={"Product_Type": "Energy"})
+
+    Optional Arguments:
+    -------------------
+    values: The columns to aggregate
+    weights: Column used to weight the averages, None to skip
+    quantiles: Quantiles to estimate, e.g. (0.5, 0.9), requires bins
+    bins: Histogram bin edges used to estimate the quantiles
+    filters: Dictionary of efilter arguments applied to each file
+    processes: Number of worker processes, 1 to run in process
+    kargs: Passed through to load_offerframe, e.g. frame_type
+
+    Returns
+    -------
+    DataFrame: Indexed by the group keys with a column for each statistic,
+               e.g. Price_mean, Price_weighted_mean, Price_q50
+
+    """
+
+    if quantiles and bins is None:
+        raise ValueError("Histogram bins must be passed to estimate quantiles")
+
+    by = [by] if isinstance(by, basestring) else list(by)
+    options = {"by": by, "values": list(values), "weights": weights,
+               "bins": bins if quantiles else None, "filters": filters,
+               "load_kargs": kargs}
+
+    tasks = [(fName, options) for fName in fNames]
+
+    if processes == 1:
+        partials = (_partial_worker(task) for task in tasks)
+        return _finalise(_reduce_partials(partials, by), options, quantiles)
+
+    from multiprocessing import Pool
+    pool = Pool(processes)
+    try:
+        partials = pool.imap_unordered(_partial_worker, tasks)
+        state = _reduce_partials(partials, by)
+    finally:
+        pool.close()
+        pool.join()
+
+    return _finalise(state, options, quantiles)
+
+
+def _load_frame(fName, load_kargs):
+    """ Load a single file as a Frame, pickled Frames are assumed to have
+    been processed already and are read as is.
+    """
+
+    if fName.endswith((".pkl", ".pickle")):
+        return Frame(pd.read_pickle(fName))
+    return load_offerframe(fName, **load_kargs)
+
+
+def _partial_worker(task):
+    """ Load a single file and compute its partial aggregate, this is
+    a module level function so that it may be sent to the process pool
+    """
+
+    fName, options = task
+    frame = _load_frame(fName, options["load_kargs"])
+    if options["filters"]:
+        frame = frame.efilter(options["filters"])
+    return partial_aggregate(frame, options["by"], options["values"],
+                             weights=options["weights"], bins=options["bins"])
+
+
+def partial_aggregate(frame, by, values, weights="Quantity", bins=None):
+    """ Compute the mergeable partial aggregate of a single Frame.
+
+    For each value column the sum, count, minimum and maximum are kept,
+    along with the weighted sum and total weight if weights are used and
+    a histogram of counts over the bins if quantiles are wanted.
+
+    Returns
+    -------
+    DataFrame: Indexed by the group keys with one column per partial state
+
+    """
+
+    arr = DataFrame(frame[[x for x in frame.columns
+                           if x in by or x in values or x == weights]])
+    for key in by:
+        if key in DERIVED_KEYS and key not in arr.columns:
+            arr[key] = frame["Trading_Period_ID"] // DERIVED_KEYS[key]
+
+    partials = []
+    grouped = arr.groupby(by)
+    for col in values:
+        stats = grouped[col].agg([np.sum, "count", np.min, np.max])
+        stats.columns = ["_".join([col, x]) for x in
+                         ("sum", "count", "min", "max")]
+        partials.append(stats)
+
+        if weights:
+            valid = arr[col].notnull()
+            weighted = DataFrame({
+                "_".join([col, "wsum"]): (arr[col] * arr[weights])[valid],
+                "_".join([col, "weight"]): arr[weights][valid]})
+            for key in by:
+                weighted[key] = arr[key][valid]
+            partials.append(weighted.groupby(by).sum())
+
+        if bins is not None:
+            partials.append(_histogram(arr, by, col, bins))
+
+    return pd.concat(partials, axis=1)
+
+
+def _histogram(arr, by, col, bins):
+    """ Count the values of a column falling within each bin per group,
+    values outside of the bins are clipped into the end bins.
+    """
+
+    positions = np.searchsorted(bins, arr[col].values, side="right") - 1
+    positions = np.clip(positions, 0, len(bins) - 2)
+
+    valid = arr[col].notnull().values
+    counts = DataFrame({"_bin": positions[valid], "_count": 1})
+    for key in by:
+        counts[key] = arr[key].values[valid]
+
+    hist = counts.groupby(by + ["_bin"])["_count"].sum().unstack("_bin")
+    hist = hist.reindex(columns=range(len(bins) - 1)).fillna(0)
+    hist.columns = ["%s_hist_%s" % (col, x) for x in hist.columns]
+    return hist
+
+
+def merge_partials(partials, by):
+    """ Merge a sequence of partial aggregates into a single partial
+    aggregate, sums, counts and histograms add whilst the minimum and
+    maximum are taken over the partials.
+    """
+
+    combined = pd.concat(partials)
+    levels = 0 if len(by) == 1 else list(range(len(by)))
+    grouped = combined.groupby(level=levels)
+
+    merged = []
+    for col in combined.columns:
+        if col.endswith("_min"):
+            merged.append(grouped[col].min())
+        elif col.endswith("_max"):
+            merged.append(grouped[col].max())
+        else:
+            merged.append(grouped[col].sum())
+
+    arr = pd.concat(merged, axis=1)
+    arr.columns = combined.columns
+    return arr
+
+
+def _reduce_partials(partials, by):
+    """ Fold the partials into a running state as they arrive so that
+    only a single partial is waiting to be merged at any one time.
+    """
+
+    state = None
+    for partial in partials:
+        if state is None:
+            state = partial
+        else:
+            state = merge_partials((state, partial), by)
+    return state
+
+
+def _finalise(state, options, quantiles=None):
+    """ Convert the merged partial state into the final statistics """
+
+    if state is None:
+        raise ValueError("No files were passed to aggregate")
+
+    result = DataFrame(index=state.index)
+    for col in options["values"]:
+        result["_".join([col, "count"])] = state["_".join([col, "count"])]
+        result["_".join([col, "sum"])] = state["_".join([col, "sum"])]
+        result["_".join([col, "min"])] = state["_".join([col, "min"])]
+        result["_".join([col, "max"])] = state["_".join([col, "max"])]
+        result["_".join([col, "mean"])] = (state["_".join([col, "sum"])] /
+                                           state["_".join([col, "count"])])
+
+        if options["weights"]:
+            weight = state["_".join([col, "weight"])]
+            result["_".join([col, "weighted_mean"])] = (
+                state["_".join([col, "wsum"])] / weight.where(weight != 0))
+
+        if quantiles:
+            hist_cols = [x for x in state.columns
+                         if x.startswith("%s_hist_" % col)]
+            hist = state[hist_cols].fillna(0).values
+            for q in quantiles:
+                result["%s_q%s" % (col, int(round(q * 100)))] = \
+                    _histogram_quantile(hist, options["bins"], q)
+
+    return result
+
+
+def _histogram_quantile(hist, bins, q):
+    """ Estimate a quantile from histogram counts per group, the value
+    returned is the midpoint of the bin containing the quantile.
+    """
+
+    bins = np.asarray(bins, dtype=float)
+    midpoints = (bins[:-1] + bins[1:]) / 2.
+    cumulative = hist.cumsum(axis=1)
+    totals = cumulative[:, -1:]
+
+    positions = (cumulative < q * totals).sum(axis=1)
+    positions = np.clip(positions, 0, len(midpoints) - 1)
+    estimate = midpoints.take(positions)
+    estimate[totals[:, 0] == 0] = np.nan
+    return estimate
+
+
+if __name__ == '__main__':
+    pass
@@ -3,19 +3,41 @@
 
 from collections import defaultdict
 import datetime
-import itertools
+import hashlib
+import json
 import os
-import simplejson
+import warnings
 
 import pandas as pd
 from pandas import DataFrame
 import numpy as np
-import matplotlib.pyplot as plt
-
-from dateutil.parser import parse
 
 import OfferPandas
 
+# matplotlib is imported when first used, importing it here adds hundreds
+# of milliseconds to the package import. dateutil is also imported when
+# used, though pandas already imports it so there is no saving.
+
+# Ordering used by a period sorted Frame, the Trading_Period_ID must be
+# the leading key as the period offsets are built from it.
+PERIOD_SORT_KEYS = ["Trading_Period_ID", "Node", "Product_Type",
+                    "Reserve_Type", "Band"]
+
+# Grid point columns which are renamed to Bus_Id
+NODAL_NAMES = ("Grid_Point", "Grid_Injection_Point", "Grid_Exit_Point")
+
+# Stacked parameter name for each band column suffix
+BAND_PARAMETERS = {"Power": "Quantity", "Max": "Quantity",
+                   "Price": "Price", "Percent": "Percent"}
+
+# Columns the validation checks need, loaded in addition to a projection
+VALIDATION_COLUMNS = ["Trading_Period_ID", "Trading_Date", "Trading_Period",
+                      "Company", "Node", "Bus_Id"]
+
+# Raw columns needed to create the derived columns
+DERIVED_COLUMNS = {"Trading_Period_ID": ("Trading_Date", "Trading_Period"),
+                   "Node": ("Bus_Id", "Station", "Unit")}
+
 def load_offerframe(fName, map_path=None, frame_type="Energy", *args, **kargs):
     """ This is a publically exposed generic function used to create
     the Frame object containing csv data. It is the primary method
@@ -25,6 +47,24 @@ def load_offerframe(fName, map_path=None, frame_type="Energy", *args, **kargs):
     ------------------
     map_path: The location of a custom mapping file to use
 
+    Optional keyword arguments, any others are passed to read_csv:
+    ---------------------------------------------------------------
+    sort: Sort the stacked frame by period and build the period offsets,
+          see Frame.sort_periods
+    validate: Move rows failing the data quality checks to a quarantine
+              frame, see Frame.validate. The offer checks run on the wide
+              frame before the Trading_Period_ID is created, so bad periods
+              and dates are quarantined rather than failing the load, and
+              the band checks run after stacking. The report and the
+              stacked quarantined rows are available as
+              frame.quality_report and frame.quarantine
+    columns: Only load the raw columns needed to create these columns of
+             the stacked frame, e.g. ["Trading_Period_ID", "Node",
+             "Company", "Price", "Quantity"]. Product_Type, Reserve_Type
+             and Band are always included. When validating the columns
+             the offer checks need are also loaded and dropped afterwards,
+             band checks on parameters which weren't loaded are skipped.
+
     Returns
     -------
     frame: A Frame object which has had a number of standard modifications
@@ -38,6 +78,18 @@ def load_offerframe(fName, map_path=None, frame_type="Energy", *args, **kargs):
     # Little bit of defensive coding
     assert frame_type in ("Energy", "PLSR_Reserve", "IL_Reserve")
 
+    # Taken from the keyword arguments so that positional arguments are
+    # still passed through to read_csv
+    sort = kargs.pop("sort", False)
+    validate = kargs.pop("validate", True)
+    columns = kargs.pop("columns", None)
+
+    # The columns to load, including those the validation checks need
+    loaded = columns
+    if columns and validate:
+        loaded = list(columns) + [x for x in VALIDATION_COLUMNS
+                                  if x not in columns]
+
     # Sanity check on the first line
     with open(fName, 'rb') as f:
         firstline = f.readline()
@@ -48,9 +100,18 @@ def load_offerframe(fName, map_path=None, frame_type="Energy", *args, **kargs):
         col_path = '_static/column_mapping.json'
         full_path = os.path.join(file_path, col_path)
 
-        column_encoding = simplejson.load(open(full_path))
-        df = pd.read_csv(fName, names=column_encoding[frame_type])
+        column_encoding = json.load(open(full_path))
+        names = column_encoding[frame_type]
+        if columns:
+            usecols = _projected_columns(names, loaded, map_path)
+            df = pd.read_csv(fName, header=None, usecols=usecols,
+                             names=[names[x] for x in usecols])
+        else:
+            df = pd.read_csv(fName, names=names)
     else:
+        if columns:
+            names = firstline.decode().rstrip("\r\n").split(",")
+            kargs["usecols"] = _projected_columns(names, loaded, map_path)
         df = pd.read_csv(fName, *args,**kargs)
 
     frame = Frame(df)
@@ -58,14 +119,162 @@ def load_offerframe(fName, map_path=None, frame_type="Energy", *args, **kargs):
     frame = frame._column_mapping()
     frame = frame._remove_data_whitespace()
     frame = frame._market_node()
-    frame = frame._map_locations(full_path=map_path)
+
+    # Look the nodes up once for both the mapping and the validation
+    rows = None
+    if validate and set(["Node", "Bus_Id"]) <= set(frame.columns):
+        rows = frame._node_metadata_rows(_load_node_metadata(map_path))
+
+    frame = frame._map_locations(full_path=map_path, columns=columns,
+                                 warn=not validate, rows=rows)
     frame = frame._parse_dates()
+
+    # Quarantine bad offers before they can break the identifier
+    if validate:
+        unmatched = None if rows is None else rows == -1
+        frame, offer_quarantine, offer_report = frame._quarantine(
+            frame._offer_checks(full_path=map_path, unmatched=unmatched))
+
     frame = frame._create_identifier()
+
+    # Drop the raw columns only needed to create the requested columns,
+    # keeping the offer keys the band checks need until they have run
+    if columns:
+        keep = set(columns)
+        if validate:
+            keep.update(frame._offer_keys())
+        frame = frame[[x for x in frame.columns if "Band" in x or x in keep]]
+
     frame = frame._stack_frame()
 
+    if validate:
+        frame, quarantine, report = frame._quarantine(frame._band_checks())
+        if len(offer_quarantine):
+            quarantine = pd.concat([offer_quarantine._stack_frame(),
+                                    quarantine], ignore_index=True)
+        report = pd.concat([offer_report, report], ignore_index=True)
+
+        failed = report[report["Rows"] > 0]
+        if len(failed):
+            warnings.warn("%s rows of %s quarantined:\n%s" % (
+                len(quarantine), fName, failed))
+
+        # A projection deliberately leaves out the bands it doesn't need, so
+        # the checks skipped as a result are only shown in the report
+        skipped = report[report["Rows"].isnull()]
+        if len(skipped) and not columns:
+            warnings.warn("Checks skipped as their columns weren't loaded: %s"
+                          % ", ".join(skipped["Check"]))
+
+    if columns and validate:
+        stacked = set(columns) | set(["Product_Type", "Reserve_Type", "Band"])
+        frame = frame[[x for x in frame.columns if x in stacked]]
+
+    if sort:
+        frame = frame.sort_periods()
+
+    if validate:
+        object.__setattr__(frame, "quality_report", report)
+        object.__setattr__(frame, "quarantine", quarantine)
+
     return frame
 
 
+def _normalise_column(name):
+    """ Title and strip all white space from a raw column name, with the
+    grid point columns given the consistent name Bus_Id
+    """
+
+    name = name.strip().title()
+    return "Bus_Id" if name in NODAL_NAMES else name
+
+
+def _projected_columns(names, columns, map_path=None):
+    """ Translate the columns wanted in the stacked frame back to the
+    positions of the raw WITS columns needed to create them, including
+    the band columns of the requested parameters.
+    """
+
+    map_columns = _load_node_metadata(map_path).columns
+    needed = set()
+    for col in columns:
+        if col in map_columns:
+            needed.update(DERIVED_COLUMNS["Node"])
+        needed.update(DERIVED_COLUMNS.get(col, (col,)))
+
+    positions = []
+    for i, name in enumerate(names):
+        name = _normalise_column(name)
+        if "Band" in name:
+            if BAND_PARAMETERS.get(name.split("_")[-1]) in columns:
+                positions.append(i)
+        elif name in needed:
+            positions.append(i)
+
+    return positions
+
+
+def _parse_date(value):
+    """ Parse a single date, returning None if it is missing or invalid """
+
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value
+
+    from dateutil.parser import parse
+    try:
+        return parse(value)
+    except (AttributeError, TypeError, ValueError, OverflowError):
+        return None
+
+
+def _period_cumsum(periods, quantity):
+    """ Cumulative sum of quantity restarted at the start of each period,
+    the periods must already be grouped together. A single cumulative sum
+    is taken with the total of the preceding periods removed.
+    """
+
+    cumulative = np.cumsum(quantity, dtype=float)
+    if not len(cumulative):
+        return cumulative
+
+    starts = np.flatnonzero(np.append(True, periods[1:] != periods[:-1]))
+    base = np.append(0, cumulative[starts[1:] - 1])
+    cumulative -= np.repeat(base, np.diff(np.append(starts, len(periods))))
+    return cumulative
+
+
+# Nodal metadata by path, shared by every file loaded
+_NODE_METADATA = {}
+
+
+def _load_node_metadata(full_path=None):
+    """ Load the nodal metadata used to map locations, this is cached by
+    path as it is reused for every file loaded.
+
+    The column names have their spaces replaced by underscores and a
+    trailing empty row is appended so that unmatched nodes may be taken
+    at position -1.
+    """
+
+    # Default to the included metadata file
+    if not full_path:
+        file_path = OfferPandas.__path__[0]
+        map_path = '_static/nodal_metadata.csv'
+        full_path = os.path.join(file_path, map_path)
+
+    if full_path not in _NODE_METADATA:
+        map_data = pd.read_csv(full_path)
+
+        # Remove the blank space and replace by underscores to merge data
+        column_mapping = {x: x.replace(' ', '_') for x in map_data.columns}
+        map_data.rename(columns=column_mapping, inplace=True)
+
+        map_data = map_data.reindex(range(len(map_data) + 1))
+        _NODE_METADATA[full_path] = map_data
+
+    return _NODE_METADATA[full_path]
+
+
 class Frame(DataFrame):
     """A Frame is a customised DataFrame object which is specific
     to Energy and Reserve market offer data. It is a base class which
@@ -79,17 +288,20 @@ class Frame(DataFrame):
 
     If creating manually, you must pass an existing Pandas DataFrame with
     the offer data in the standard WITS format.
-    """
-
-    def __new__(cls, *args, **kargs):
 
-        arr = DataFrame.__new__(cls)
+    Frame follows the pandas subclassing protocol, the results of slicing,
+    merging, concatenating and grouping a Frame are themselves Frames and
+    do not need to be wrapped again.
+    """
 
-        if type(arr) is Frame:
-            return arr
-        else:
-            return arr.view(Frame)
+    # Attributes propagated by pandas to derived Frames. The period offsets
+    # are deliberately excluded, they only describe the Frame they were
+    # built upon and must be rebuilt for any derived Frame.
+    _metadata = []
 
+    @property
+    def _constructor(self):
+        return Frame
 
     def modify_frame(self):
 
@@ -113,15 +325,11 @@ class Frame(DataFrame):
         Frame: A Frame object for method chaining.
 
         """
-        # Title and strip all white space from the columns
-        column_mapping = {x: x.strip().title() for x in self.columns}
+        # Title and strip all white space from the columns and update the
+        # grid names to a consistent naming structure
+        column_mapping = {x: _normalise_column(x) for x in self.columns}
         self.rename(columns=column_mapping, inplace=True)
 
-        # Update the grid names to a consistent naming structure
-        nodal_names = ("Grid_Point", "Grid_Injection_Point", "Grid_Exit_Point")
-        nodal_mapping = {x: "Bus_Id" for x in nodal_names}
-        self.rename(columns=nodal_mapping, inplace=True)
-
         return self
 
     def _remove_data_whitespace(self):
@@ -138,19 +346,17 @@ class Frame(DataFrame):
         """
 
         # Apply the stripping to columns which are an Object type
-        # Use a throwaway lambda function to do this
-        strip = lambda x: x.strip()
+        # Use a throwaway lambda function to do this, missing values and
+        # other non strings are left as is for validation to pick up
+        strip = lambda x: x.strip() if isinstance(x, basestring) else x
         for col in self.columns:
             if self[col].dtype == "O":
-                try:
-                    self[col] = self[col].apply(strip)
-                except AttributeError as e:
-                    print e
-
+                self[col] = self[col].apply(strip)
 
         return self
 
-    def _map_locations(self, full_path=None):
+    def _map_locations(self, full_path=None, drop_unmatched=False,
+                       columns=None, warn=True, rows=None):
         """ Map the OfferFrame with location data from a reference CSV file
         There is a default CSV file included although a custom file may also
         be passed as necessary.
@@ -160,6 +366,24 @@ class Frame(DataFrame):
         especially in conjunction with the filtering methods. Data does not
         exist for all columns, e.g. Company Name and IL providers.
 
+        The (Node, Bus_Id) pairs are encoded as integers and only the unique
+        pairs are looked up against the metadata, the metadata columns are
+        then taken row wise from the pre-built arrays instead of merging on
+        the string columns. Nodes missing from the metadata are kept with
+        empty location data and reported with a warning.
+
+        Optional Arguments:
+        -------------------
+        full_path: The location of a custom metadata file to use
+        drop_unmatched: Remove rows whose node is missing from the metadata,
+                        this matches the old inner merge behaviour.
+        columns: Only add these metadata columns, nothing is done if none
+                 of the metadata columns are wanted
+        warn: Warn about nodes missing from the metadata, load_offerframe
+              leaves this to the validation report instead
+        rows: The metadata rows from _node_metadata_rows if they have
+              already been looked up
+
         Added Columns:
         --------------
             (Location_Name, Load_Area, Island_Name, Region,
@@ -170,24 +394,250 @@ class Frame(DataFrame):
         Frame: Locational Metadata added based upon a static path
 
         """
-        # Get the Map data as a DataFrame object
-        # Default to the included metadata file
-        if not full_path:
-            file_path = OfferPandas.__path__[0]
-            map_path = '_static/nodal_metadata.csv'
-            full_path = os.path.join(file_path, map_path)
 
-        map_data = pd.read_csv(full_path)
+        map_data = _load_node_metadata(full_path)
+        map_points = ["Node", "Bus_Id"]
+        map_columns = [x for x in map_data.columns if x not in map_points and
+                       (columns is None or x in columns)]
+        if not map_columns or not set(map_points) <= set(self.columns):
+            return self
 
-        # Remove the blank space and replace by underscores to merge data
-        column_mapping = {x: x.replace(' ', '_') for x in map_data.columns}
-        map_data.rename(columns=column_mapping, inplace=True)
+        if rows is None:
+            rows = self._node_metadata_rows(map_data)
 
-        # Merging the data will spit it back as a general data frame so
-        # We need to call Frame again
-        map_points = ["Node", "Bus_Id"]
-        return Frame(self.merge(map_data, left_on=map_points,
-                                          right_on=map_points))
+        unmatched = rows == -1
+        if warn and unmatched.any():
+            missing = self[["Node", "Bus_Id"]][unmatched].drop_duplicates()
+            names = ", ".join(missing["Node"].astype(str))
+            warnings.warn("%s nodes missing from the location metadata: %s" %
+                          (len(missing), names))
+
+        # The metadata has a trailing empty row so that a take of -1 leaves
+        # the unmatched rows with missing values
+        for col in map_columns:
+            self[col] = map_data[col].values.take(rows)
+
+        if drop_unmatched and unmatched.any():
+            return self[~unmatched]
+
+        return self
+
+    def _node_metadata_rows(self, map_data):
+        """ Determine the row of the metadata which matches each row of the
+        Frame, -1 where the node doesn't exist in the metadata.
+
+        The Node and Bus_Id columns are factorized to integer codes and
+        combined into a single key so that only the unique pairs, rather
+        than every row, are hashed against the metadata. Missing values are
+        factorized to -1, which would decode to a real pair, so those rows
+        are left unmatched.
+        """
+
+        node_codes, node_uniques = pd.factorize(self["Node"])
+        bus_codes, bus_uniques = pd.factorize(self["Bus_Id"])
+        pair_codes = node_codes * len(bus_uniques) + bus_codes
+        unique_pairs, inverse = np.unique(pair_codes, return_inverse=True)
+
+        lookup = {(node, bus): i for i, (node, bus) in
+                  enumerate(zip(map_data["Node"], map_data["Bus_Id"]))}
+
+        pair_rows = np.array([lookup.get((node_uniques[x // len(bus_uniques)],
+                                          bus_uniques[x % len(bus_uniques)]),
+                                         -1) for x in unique_pairs],
+                             dtype=np.int64)
+
+        rows = pair_rows.take(inverse)
+        rows[(node_codes == -1) | (bus_codes == -1)] = -1
+        return rows
+
+    def unmatched_nodes(self, full_path=None):
+        """ Report the nodes within the Frame which don't exist in the
+        location metadata and would have empty location data.
+
+        Returns
+        -------
+        DataFrame: The unique (Node, Bus_Id) pairs which were not matched
+
+        """
+
+        map_data = _load_node_metadata(full_path)
+        unmatched = self._node_metadata_rows(map_data) == -1
+        missing = self[["Node", "Bus_Id"]][unmatched].drop_duplicates()
+        return missing.reset_index(drop=True)
+
+    def validate(self, full_path=None):
+        """ Run the data quality checks over a Frame, each check is a
+        vectorized mask over the whole Frame. load_offerframe runs the offer
+        checks on the wide frame, before the identifier is created, and the
+        band checks once the frame has been stacked.
+
+        Checks which need columns missing from the Frame are reported as
+        skipped, with a null row count, rather than silently left out.
+
+        Offer Checks:
+        -------------
+            Trading_Period outside of 1 to 50
+            Missing or invalid Trading_Date
+            Node missing from the location metadata
+            Duplicate offer key, (period, Company, Node) as well as
+            (Product_Type, Reserve_Type, Band) on a stacked Frame, the first
+            occurrence is kept
+
+        Band Checks:
+        ------------
+            Missing or negative Quantity
+            Missing Price
+            Band Price lower than the offered Band before it within an offer,
+            bands with no quantity are ignored
+
+        Optional Arguments:
+        -------------------
+        full_path: The location of a custom metadata file to check against
+
+        Returns
+        -------
+        clean: Frame of the rows which passed every check
+        quarantine: Frame of the failing rows with an Issue column naming
+                    the first check failed
+        report: DataFrame with the number of rows failing each check
+
+        """
+
+        return self._quarantine(self._offer_checks(full_path) +
+                                self._band_checks())
+
+    def _offer_checks(self, full_path=None, unmatched=None):
+        """ The checks which apply to a whole offer and so may be run on the
+        wide frame, a list of (name, mask) with a mask of None where the
+        check was skipped. The unmatched node mask may be passed if the
+        nodes have already been looked up.
+        """
+
+        columns = set(self.columns)
+        checks = []
+
+        if "Trading_Period" in columns:
+            period = self["Trading_Period"]
+            mask = ~((period >= 1) & (period <= 50)).values
+        else:
+            mask = None
+        checks.append(("Trading_Period outside 1-50", mask))
+
+        if "Trading_Date" in columns:
+            mask = self["Trading_Date"].isnull().values
+        else:
+            mask = None
+        checks.append(("Missing or invalid Trading_Date", mask))
+
+        if unmatched is not None:
+            mask = unmatched
+        elif {"Node", "Bus_Id"} <= columns:
+            map_data = _load_node_metadata(full_path)
+            mask = self._node_metadata_rows(map_data) == -1
+        else:
+            mask = None
+        checks.append(("Node missing from metadata", mask))
+
+        keys = self._offer_keys()
+        if "Band" in columns:
+            keys = keys + ["Product_Type", "Reserve_Type", "Band"]
+        if set(keys) <= columns:
+            mask = self.duplicated(keys).values
+        else:
+            mask = None
+        checks.append(("Duplicate offer key", mask))
+
+        return checks
+
+    def _band_checks(self):
+        """ The checks which apply to individual bands of a stacked Frame,
+        a list of (name, mask) with a mask of None where the check was
+        skipped.
+        """
+
+        columns = set(self.columns)
+        checks = []
+
+        if "Quantity" in columns:
+            mask = ~(self["Quantity"] >= 0).values
+        else:
+            mask = None
+        checks.append(("Missing or negative Quantity", mask))
+
+        if "Price" in columns:
+            mask = self["Price"].isnull().values
+        else:
+            mask = None
+        checks.append(("Missing Price", mask))
+
+        keys = self._offer_keys() + ["Product_Type", "Reserve_Type", "Band",
+                                     "Price", "Quantity"]
+        if set(keys) <= columns:
+            mask = self._decreasing_band_prices()
+        else:
+            mask = None
+        checks.append(("Band Price decreasing", mask))
+
+        return checks
+
+    def _offer_keys(self):
+        """ The columns identifying an offer, the Company is included as IL
+        offers use the Bus_Id as the Node and several providers may offer
+        at the same Grid Exit Point.
+        """
+
+        if "Trading_Period_ID" in self.columns:
+            period = ["Trading_Period_ID"]
+        else:
+            period = ["Trading_Date", "Trading_Period"]
+        return period + ["Company", "Node"]
+
+    def _quarantine(self, checks):
+        """ Split the Frame into the rows passing and failing the checks,
+        the failing rows are labelled with the first check they failed.
+
+        Returns
+        -------
+        clean, quarantine, report: See validate
+
+        """
+
+        issue = np.empty(len(self), dtype=object)
+        for name, mask in checks[::-1]:
+            if mask is not None:
+                issue[mask] = name
+        failed = pd.notnull(issue)
+
+        rows = [np.nan if x[1] is None else int(x[1].sum()) for x in checks]
+        report = DataFrame({"Check": [x[0] for x in checks], "Rows": rows},
+                           columns=["Check", "Rows"])
+
+        quarantine = self[failed].copy()
+        quarantine["Issue"] = issue[failed]
+        return self[~failed], quarantine, report
+
+    def _decreasing_band_prices(self):
+        """ Mask of the bands priced lower than the offered band before
+        them within the same offer, i.e. the same period, company, node,
+        product and reserve type. Only bands with a quantity are compared as
+        unused bands are normally 0 MW at $0.
+        """
+
+        offered = np.flatnonzero((self["Quantity"] > 0).values)
+        group_keys = self._offer_keys() + ["Product_Type", "Reserve_Type"]
+        codes = [pd.factorize(self[x])[0][offered] for x in group_keys]
+        order = np.lexsort([self["Band"].values[offered]] + codes[::-1])
+
+        current, previous = order[1:], order[:-1]
+        same_offer = np.ones(len(current), dtype=bool)
+        for code in codes:
+            same_offer &= code[current] == code[previous]
+
+        price = self["Price"].values[offered]
+        decreasing = np.zeros(len(self), dtype=bool)
+        decreasing[offered[current]] = same_offer & (price[current] <
+                                                     price[previous])
+        return decreasing
 
     def _create_identifier(self):
         """ Create the Trading Period Identifier to make merging easier
@@ -195,6 +645,9 @@ class Frame(DataFrame):
         yyyymmddpp and is stored as an integer where possible
         """
 
+        if not {"Trading_Date", "Trading_Period"} <= set(self.columns):
+            return self
+
         date_lam = lambda x: x.strftime('%Y%m%d')
         period_lam = lambda x: "%02d" % x
 
@@ -208,11 +661,18 @@ class Frame(DataFrame):
         """ Parse the dates using the general parse function from dateutils
         Then apply this as a mapping, this is done as parsing many dates can
         be very slow, this method is much quicker
+
+        Missing dates, or dates which can't be parsed, are left missing to
+        be picked up by validation.
         """
 
+        if "Trading_Date" not in self.columns:
+            return self
+
         unique_dates = self["Trading_Date"].unique()
-        if type(self["Trading_Date"][0]) not in (datetime.date, datetime.datetime):
-            date_mapping = {x: parse(x) for x in unique_dates}
+        if not all(type(x) in (datetime.date, datetime.datetime)
+                   for x in unique_dates):
+            date_mapping = {x: _parse_date(x) for x in unique_dates}
             self["Trading_Date"] =  self["Trading_Date"].map(date_mapping)
         return self
 
@@ -229,6 +689,9 @@ class Frame(DataFrame):
 
         """
 
+        if "Bus_Id" not in self.columns:
+            return self
+
         if "Unit" in self.columns:
             station = self["Station"] + self["Unit"].astype(str)
             identifier = self["Bus_Id"].astype(str) + " " + station
@@ -254,7 +717,7 @@ class Frame(DataFrame):
         arr = pd.concat(self._yield_frame(), ignore_index=True)
         max_names = ("Power", "Max")
         arr.rename(columns={x: "Quantity" for x in max_names}, inplace=True)
-        return Frame(arr)
+        return arr
 
     def _yield_frame(self):
 
@@ -349,7 +812,7 @@ class Frame(DataFrame):
                intact
         """
 
-        arr = self.copy()
+        arr = self
         if args:
             for key, value in args[0].iteritems():
                 if hasattr(value, "__iter__"):
@@ -366,7 +829,7 @@ class Frame(DataFrame):
                 else:
                     arr = arr[arr[key] == value]
 
-        return Frame(arr)
+        return arr if arr is not self else self.copy()
 
 
     def rfilter(self, *args, **kargs):
@@ -391,17 +854,17 @@ class Frame(DataFrame):
                intact
 
         """
-        arr = self.copy()
+        arr = self
 
         if args:
-            for key, value in args[0].iteritems():
+            for key, values in args[0].iteritems():
                 arr = arr[(arr[key] >= values[0]) & (arr[key] <= values[1])]
 
         if kargs:
             for key, values in kargs.iteritems():
                 arr = arr[(arr[key] >= values[0]) & (arr[key] <= values[1])]
 
-        return Frame(arr)
+        return arr if arr is not self else self.copy()
 
 
     def nfilter(self, *args, **kargs):
@@ -426,7 +889,7 @@ class Frame(DataFrame):
 
         """
 
-        arr = self.copy()
+        arr = self
 
         if args:
             for key, value in args[0].iteritems():
@@ -444,9 +907,138 @@ class Frame(DataFrame):
                 else:
                     arr = arr[arr[key] != value]
 
-        return Frame(arr)
+        return arr if arr is not self else self.copy()
+
+    def sort_periods(self):
+        """ Sort the Frame by (Trading_Period_ID, Node, Product_Type,
+        Reserve_Type, Band) and build an offsets array marking where each
+        Trading Period begins. Once sorted a period, or a range of periods,
+        is a contiguous block of rows which can be located with a binary
+        search instead of a boolean scan of the entire column.
+
+        Example Usage:
+        --------------
+            sorted_frame = Frame.sort_periods()
+            sorted_frame.period(2013010101)
+            sorted_frame.periods(2013010101, 2013010148)
+
+        Returns
+        -------
+        Frame: A new, period sorted, Frame with a fresh integer index.
+
+        """
+
+        keys = [x for x in PERIOD_SORT_KEYS if x in self.columns]
+        arr = self.sort(columns=keys).reset_index(drop=True)
+        arr._build_period_offsets()
+        return arr
+
+    def _build_period_offsets(self):
+        """ Build the unique Trading Period Ids and the offsets array for
+        a Frame which is already sorted by period. The offsets array has
+        one more entry than the number of periods so that period i
+        occupies the rows offsets[i]:offsets[i+1].
+        """
+
+        tpid = self["Trading_Period_ID"].values
+        keys, starts = np.unique(tpid, return_index=True)
+        offsets = np.append(starts, len(tpid))
+
+        # Set directly on the object so pandas does not treat these as columns
+        object.__setattr__(self, "_period_keys", keys)
+        object.__setattr__(self, "_period_offsets", offsets)
+        return self
+
+    def _is_period_sorted(self):
+        """ Check that the period offsets exist and still line up with the
+        current Frame. The length and the Trading_Period_ID at the first and
+        last row of every period are checked, which catches rows added or
+        removed, re-sorting and reassigning the Trading_Period_ID. Other in
+        place changes which keep every period boundary intact, e.g.
+        swapping rows between two periods, are not detected and the Frame
+        should be sorted again with sort_periods.
+        """
+
+        offsets = getattr(self, "_period_offsets", None)
+        if offsets is None or "Trading_Period_ID" not in self.columns:
+            return False
+        if offsets[-1] != len(self):
+            return False
+
+        tpid = self["Trading_Period_ID"].values
+        keys = self._period_keys
+        return (np.array_equal(tpid[offsets[:-1]], keys) and
+                np.array_equal(tpid[offsets[1:] - 1], keys))
+
+    def period(self, tpid):
+        """ Return the offers for a single Trading Period Id. On a period
+        sorted Frame this is a binary search returning a contiguous slice,
+        otherwise it falls back to efilter.
+
+        Example Usage:
+        --------------
+            Frame.period(2013010101)
+
+        Returns
+        -------
+        Frame: The offers for the Trading Period, empty if it doesn't exist
+
+        """
+
+        if not self._is_period_sorted():
+            return self.efilter(Trading_Period_ID=tpid)
+
+        keys, offsets = self._period_keys, self._period_offsets
+        i = keys.searchsorted(tpid)
+        if i == len(keys) or keys[i] != tpid:
+            return self.iloc[0:0]
+        return self.iloc[offsets[i]:offsets[i+1]]
+
+    def periods(self, begin, end):
+        """ Return the offers for all Trading Period Ids between begin and
+        end inclusive. On a period sorted Frame this is a binary search
+        returning a contiguous slice, otherwise it falls back to rfilter.
+
+        Example Usage:
+        --------------
+            Frame.periods(2013010101, 2013010148) # All of the 1st Jan
+
+        Returns
+        -------
+        Frame: The offers for the Trading Periods within the range
+
+        """
+
+        if not self._is_period_sorted():
+            return self.rfilter(Trading_Period_ID=(begin, end))
 
-    def offer_stack(self, minimum_quantity=0.001):
+        keys, offsets = self._period_keys, self._period_offsets
+        lower = keys.searchsorted(begin, side="left")
+        upper = keys.searchsorted(end, side="right")
+        arr = self.iloc[offsets[lower]:offsets[upper]]
+        return arr._build_period_offsets()
+
+    def iter_periods(self):
+        """ Iterate over the Trading Periods of the Frame without any
+        masking, the Frame will be sorted first if necessary.
+
+        Example Usage:
+        --------------
+            for tpid, arr in Frame.iter_periods():
+                ...
+
+        Returns
+        -------
+        generator: (Trading_Period_ID, Frame) pairs in period order
+
+        """
+
+        arr = self if self._is_period_sorted() else self.sort_periods()
+        keys, offsets = arr._period_keys, arr._period_offsets
+        for i, tpid in enumerate(keys):
+            yield tpid, arr.iloc[offsets[i]:offsets[i+1]]
+
+    def offer_stack(self, minimum_quantity=0.001, processes=None):
         """ Return an Offer Stack (group of price and quantity pairs)
         for a particular offer frame.
 
@@ -459,11 +1051,15 @@ class Frame(DataFrame):
         -------------------
         minimum_quantity: Exclude offers below a certain quantity (e.g. 0.1)
                           May improve clarity as some 0.001 offers exist.
+        processes: Stack the periods across this many worker processes
+                   sharing the columns in memory, see
+                   Parallel.parallel_offer_stack
 
 
         Example Usage:
         --------------
             Frame.offer_stack(minimum_quantity=0.001)
+            Frame.offer_stack(processes=4)
 
         Returns:
         --------
@@ -473,23 +1069,275 @@ class Frame(DataFrame):
 
         """
 
+        if processes and processes > 1:
+            from Parallel import parallel_offer_stack
+            return parallel_offer_stack(self, processes=processes,
+                                        minimum_quantity=minimum_quantity)
+
         def _offer_stack(arr, minimum_quantity=0.001):
             arr = arr.rfilter(Quantity=(minimum_quantity, 1000000))
             arr = arr.sort(columns=["Price", "Quantity"], ascending=[1,0])
             arr["Cumulative_Quantity"] = arr["Quantity"].cumsum()
             return arr
 
-        arr = Frame(self.copy())
-        unique_tpid = arr["Trading_Period_ID"].unique()
-        if len(unique_tpid) == 1:
-            return Frame(_offer_stack(arr, minimum_quantity=minimum_quantity))
+        stacks = [_offer_stack(arr, minimum_quantity=minimum_quantity)
+                  for tpid, arr in self.iter_periods()]
+        if len(stacks) == 1:
+            return stacks[0]
+
+        elif len(stacks) > 1:
+            return pd.concat(stacks, ignore_index=True)
+
+    def offer_changes(self, other=None, parameters=("Price", "Quantity")):
+        """ Find the offer bands whose price or quantity changed, either
+        between consecutive Trading Periods of this Frame or between this
+        Frame and a later version of the same offers, e.g. the initial and
+        the amended offers.
+
+        The offers are sorted once by (Company, Node, Product_Type,
+        Reserve_Type, Band, Trading_Period_ID) and each row compared with
+        the row before it, so only a single pass is needed rather than a
+        self merge. Offers which exist in only one version are not reported,
+        nor are duplicate keys within a single period or version.
+
+        The two versions must be supplied by the caller, e.g. by loading
+        the initial and the amended files, the Created_Date and
+        Last_Amended_Date columns are not used to separate them.
 
-        elif len(unique_tpid) > 1:
-            return Frame(pd.concat((
-                    _offer_stack(arr.efilter(Trading_Period_ID=tpid),
-                                 minimum_quantity=minimum_quantity)
-                             for tpid in unique_tpid),
-                            ignore_index=True))
+        Example Usage:
+        --------------
+            Frame.offer_changes() # Changes between consecutive periods
+            initial.offer_changes(amended) # Changes made by amendments
+
+        Optional Arguments:
+        -------------------
+        other: A later version of the offers to compare against
+        parameters: The columns to compare
+
+        Returns
+        -------
+        Frame: One row per changed band with the key columns, the current
+               values, Previous_<parameter> and <parameter>_Change columns.
+               Period changes also include Previous_Trading_Period_ID.
+
+        """
+
+        # The Company separates IL providers offering at the same node
+        band_keys = [x for x in ["Company"] + PERIOD_SORT_KEYS[1:]
+                     if x in self.columns]
+        parameters = list(parameters)
+
+        if other is None:
+            arr = self
+            group_keys = band_keys
+        else:
+            arr = pd.concat([self, other], ignore_index=True)
+            group_keys = band_keys + ["Trading_Period_ID"]
+
+        # Integer codes make the sort and the shifted comparisons cheap
+        codes = [pd.factorize(arr[x])[0] for x in group_keys]
+        if other is None:
+            lexkeys = [arr["Trading_Period_ID"].values] + codes[::-1]
+        else:
+            version = np.repeat([0, 1], [len(self), len(other)])
+            lexkeys = [version] + codes[::-1]
+        order = np.lexsort(lexkeys)
+
+        current, previous = order[1:], order[:-1]
+        same_band = np.ones(len(current), dtype=bool)
+        for code in codes:
+            same_band &= code[current] == code[previous]
+
+        # Only pair an offer with its counterpart in the other version or
+        # the previous period, a duplicate key is not a change
+        if other is None:
+            tpid = arr["Trading_Period_ID"].values
+            same_band &= tpid[current] != tpid[previous]
+        else:
+            same_band &= version[current] != version[previous]
+
+        changed = np.zeros(len(current), dtype=bool)
+        for param in parameters:
+            values = arr[param].values
+            now, before = values[current], values[previous]
+            changed |= (now != before) & ~(pd.isnull(now) & pd.isnull(before))
+        changed &= same_band
+
+        current, previous = current[changed], previous[changed]
+        columns = band_keys + ["Trading_Period_ID"] + parameters
+        deltas = arr[columns].iloc[current].reset_index(drop=True)
+
+        if other is None:
+            deltas["Previous_Trading_Period_ID"] = \
+                arr["Trading_Period_ID"].values[previous]
+
+        for param in parameters:
+            before = arr[param].values[previous]
+            deltas["Previous_" + param] = before
+            deltas[param + "_Change"] = deltas[param].values - before
+
+        return deltas
+
+    def competition_metrics(self, demand, company="Company", price_cap=None,
+                            minimum_quantity=0.001):
+        """ Calculate market power screening metrics for every company in
+        every Trading Period with a single groupby over (period, company).
+
+        The Residual Supply Index (RSI) of a company is the capacity offered
+        by all other companies divided by the demand, a company is pivotal
+        when the demand cannot be met without it, i.e. RSI < 1.
+
+        The demand is for a single product, so the Frame must be filtered
+        to a single Product_Type and Reserve_Type first.
+
+        Example Usage:
+        --------------
+            Frame.efilter(Product_Type="Energy").competition_metrics(demand)
+
+        Arguments:
+        ----------
+        demand: A Series, or dictionary, of demand indexed by Trading_Period_ID
+
+        Optional Arguments:
+        -------------------
+        company: The column identifying a supplier, e.g. Company_Name
+        price_cap: Only count capacity offered at or below this price
+        minimum_quantity: Exclude offers below this quantity
+
+        Returns
+        -------
+        Frame: One row per (Trading_Period_ID, company) with the columns
+               Offered_Capacity, Total_Capacity, Demand,
+               Residual_Supply_Index and Pivotal. Pivotal is null for
+               periods missing from the demand.
+
+        """
+
+        for col in ("Product_Type", "Reserve_Type"):
+            if col in self.columns and self[col].nunique() > 1:
+                raise ValueError("competition_metrics needs a single %s, "
+                                 "filter the Frame first" % col)
+
+        mask = (self["Quantity"] >= minimum_quantity).values
+        if price_cap is not None:
+            mask &= (self["Price"] <= price_cap).values
+
+        arr = self[["Trading_Period_ID", company, "Quantity"]][mask]
+        capacity = arr.groupby(["Trading_Period_ID", company])[
+            "Quantity"].sum()
+
+        metrics = Frame({"Offered_Capacity": capacity}).reset_index()
+        metrics["Total_Capacity"] = metrics.groupby("Trading_Period_ID")[
+            "Offered_Capacity"].transform(np.sum)
+
+        demand = pd.Series(demand)
+        metrics["Demand"] = demand.reindex(
+            metrics["Trading_Period_ID"].values).values
+
+        residual = metrics["Total_Capacity"] - metrics["Offered_Capacity"]
+        metrics["Residual_Supply_Index"] = residual / metrics["Demand"]
+
+        # Pivotal is left null where the demand is missing, rather than
+        # screening the company as not pivotal
+        pivotal = (residual < metrics["Demand"]).values.astype(object)
+        pivotal[metrics["Demand"].isnull().values] = np.nan
+        metrics["Pivotal"] = pivotal
+
+        return metrics
+
+    def supply_curves(self, grid, axis="quantity", split=None,
+                      minimum_quantity=0.001, cache_dir=None):
+        """ Build the supply curve of every Trading Period on a common grid
+        as a dense matrix with one row per period.
+
+        With axis="quantity" the grid is in MW and each entry is the price
+        of the marginal offer needed to supply that quantity, NaN beyond the
+        total offered. With axis="price" the grid is in $/MWh and each entry
+        is the cumulative MW offered at or below that price.
+
+        All periods are located with a single searchsorted by offsetting
+        each period's cumulative quantities (or prices) onto its own range,
+        so no per period loop is needed.
+
+        Example Usage:
+        --------------
+            tpids, curves = Frame.supply_curves(np.arange(0, 5000, 10))
+            tpids, curves = Frame.supply_curves(np.arange(0, 300, 1),
+                                                axis="price",
+                                                split="Island_Name")
+
+        Optional Arguments:
+        -------------------
+        axis: "quantity" or "price", the units of the grid
+        split: Column to build separate matrices for, e.g. Island_Name,
+               rows with a missing value are left out with a warning
+        minimum_quantity: Exclude offers below this quantity
+        cache_dir: Directory to cache the matrices in, keyed by a hash of
+                   the source data and the arguments
+
+        Returns
+        -------
+        tpids: The Trading_Period_IDs of the rows
+        curves: A (periods x grid) array, or a dictionary of these indexed
+                by the values of the split column
+
+        """
+
+        assert axis in ("quantity", "price")
+        grid = np.asarray(grid, dtype=float)
+
+        columns = ["Trading_Period_ID", "Price", "Quantity"]
+        if split:
+            columns.append(split)
+        arr = self[columns][(self["Quantity"] >= minimum_quantity).values]
+
+        # Missing split values are factorized to -1 and belong to no curve
+        if split:
+            missing = arr[split].isnull().sum()
+            if missing:
+                warnings.warn("%s rows with a missing %s left out of the "
+                              "supply curves" % (missing, split))
+
+        if cache_dir:
+            digest = hashlib.sha1(repr((axis, split, minimum_quantity)))
+            digest.update(np.ascontiguousarray(grid).tostring())
+            for col in columns:
+                codes, labels = pd.factorize(arr[col])
+                digest.update(np.ascontiguousarray(codes).tostring())
+                digest.update(repr(list(labels)))
+            cache_path = os.path.join(cache_dir, "supply_curves_%s.npz" %
+                                      digest.hexdigest())
+            if os.path.exists(cache_path):
+                cached = np.load(cache_path)
+                curves = dict(zip(cached["labels"].tolist(), cached["curves"]))
+                return cached["tpids"], curves if split else curves[""]
+
+        tpids, ranks = np.unique(arr["Trading_Period_ID"].values,
+                                 return_inverse=True)
+
+        if split:
+            groups = pd.factorize(arr[split])
+        else:
+            groups = (np.zeros(len(arr), dtype=int), [""])
+
+        curves = {}
+        for i, name in enumerate(groups[1]):
+            mask = groups[0] == i
+            curves[name] = _supply_curve(ranks[mask],
+                                         arr["Price"].values[mask],
+                                         arr["Quantity"].values[mask],
+                                         len(tpids), grid, axis)
+
+        if cache_dir:
+            # The labels are saved alongside the stacked curves so that the
+            # original keys, rather than strings, are restored on a hit
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            labels = list(groups[1])
+            np.savez(cache_path, tpids=tpids, labels=np.array(labels),
+                     curves=np.array([curves[k] for k in labels]))
+
+        return tpids, curves if split else curves[""]
 
     def plot_stack(self, figsize=(8,8)):
         """ Convenience Function to plot the offers, will return an error
@@ -508,10 +1356,11 @@ class Frame(DataFrame):
                 Trading Period, current number of trading periods is\
                 %s, must be 1" % len(unique_tpid))
 
+        import matplotlib.pyplot as plt
         fig, axes = plt.subplots(1,1, figsize=figsize)
 
-        axes.plot(arr["Cumulative_Quantity"], arr["Price"], drawstyle=steps,
-                  linewidth=3, alpha=0.8, c='k', markerstyle='x')
+        axes.plot(arr["Cumulative_Quantity"], arr["Price"], drawstyle="steps",
+                  linewidth=3, alpha=0.8, c='k', marker='x')
 
         plot_type = arr["Reserve_Type"].unique()[0]
         axes.set_xlabel(" ".join([plot_type, "Quantity [MW]"]),
@@ -523,6 +1372,51 @@ class Frame(DataFrame):
 
 
 
+def _supply_curve(ranks, price, quantity, periods, grid, axis):
+    """ The dense (periods x grid) supply curve matrix for offers whose
+    period is given by its rank within the sorted Trading_Period_IDs.
+    """
+
+    order = np.lexsort((-quantity, price, ranks))
+    ranks, price = ranks[order], price[order]
+    cumulative = _period_cumsum(ranks, quantity[order])
+
+    rows = np.arange(periods)
+    starts = np.searchsorted(ranks, rows, side="left")
+    stops = np.searchsorted(ranks, rows, side="right")
+
+    if axis == "quantity":
+        # Offset each period's cumulative quantity onto its own range
+        totals = np.zeros(periods)
+        has_offers = stops > starts
+        totals[has_offers] = cumulative[stops[has_offers] - 1]
+        stride = max(totals.max() if periods else 0, grid.max()) + 1.
+        keys = cumulative + ranks * stride
+        queries = grid[None, :] + rows[:, None] * stride
+
+        positions = np.searchsorted(keys, queries.ravel(), side="left")
+        positions = np.clip(positions, 0, max(len(keys) - 1, 0))
+        curves = price.take(positions).reshape(queries.shape) \
+            if len(keys) else np.zeros(queries.shape)
+        curves[grid[None, :] > totals[:, None]] = np.nan
+        curves[~has_offers] = np.nan
+
+    else:
+        # Offset each period's prices onto their own range
+        low = min(price.min() if len(price) else 0, grid.min())
+        stride = max(price.max() if len(price) else 0, grid.max()) - low + 1.
+        keys = price - low + ranks * stride
+        queries = (grid[None, :] - low) + rows[:, None] * stride
+
+        positions = np.searchsorted(keys, queries.ravel(), side="right") - 1
+        positions = positions.reshape(queries.shape)
+        offered = positions >= starts[:, None]
+        curves = np.zeros(queries.shape)
+        curves[offered] = cumulative.take(positions[offered])
+
+    return curves
+
+
 if __name__ == '__main__':
     pass
 
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import ctypes
+
+import pandas as pd
+import numpy as np
+
+from Frames import _period_cumsum
+from Aggregate import DERIVED_KEYS, partial_aggregate, merge_partials, \
+    _finalise
+
+# The shared column buffers of the pool a worker belongs to, set by the
+# pool initializer so the buffers are inherited rather than pickled.
+_SHARED = {}
+
+
+class SharedColumns(object):
+    """ A set of Frame columns copied once into shared memory buffers so
+    that worker processes can read them without the Frame being pickled.
+
+    Numeric columns are shared as is, object columns are encoded as integer
+    codes with the labels kept in the parent process to decode results.
+    """
+
+    def __init__(self, frame, columns):
+        from multiprocessing import RawArray
+
+        self.buffers = {}
+        self.labels = {}
+        for col in columns:
+            values = frame[col].values
+            if values.dtype == object:
+                values, self.labels[col] = pd.factorize(frame[col])
+
+            values = np.ascontiguousarray(values)
+            buf = RawArray(ctypes.c_char, max(values.nbytes, 1))
+            view = np.frombuffer(buf, dtype=values.dtype, count=len(values))
+            view[:] = values
+            self.buffers[col] = (buf, values.dtype.str, len(values))
+
+    def decode(self, arr, columns):
+        """ Replace the integer codes in the columns of a DataFrame with
+        their original labels.
+        """
+
+        for col in columns:
+            if col in self.labels:
+                codes = arr[col].values
+                labels = np.asarray(self.labels[col], dtype=object).take(codes)
+                labels[codes == -1] = np.nan
+                arr[col] = labels
+        return arr
+
+
+def _init_worker(buffers):
+    _SHARED.clear()
+    _SHARED.update(buffers)
+
+
+def _shared_arrays(start, stop):
+    """ Views, not copies, of rows start:stop of the shared columns """
+
+    return {col: np.frombuffer(buf, dtype=dtype, count=length)[start:stop]
+            for col, (buf, dtype, length) in _SHARED.items()}
+
+
+def _partition(offsets, parts):
+    """ Split a Frame into at most parts contiguous row ranges of similar
+    size, the ranges are aligned with the period offsets so that no
+    Trading Period is split between two workers.
+    """
+
+    targets = np.linspace(0, offsets[-1], parts + 1)
+    positions = np.clip(np.searchsorted(offsets, targets), 0, len(offsets) - 1)
+    cuts = np.unique(np.append(offsets[positions], [0, offsets[-1]]))
+    return zip(cuts[:-1], cuts[1:])
+
+
+def _run(shared, worker, tasks, processes):
+    """ Map the tasks over a pool whose workers share the column buffers,
+    the results are returned in the order of the tasks.
+    """
+
+    if not tasks:
+        return []
+
+    from multiprocessing import Pool
+    pool = Pool(processes, initializer=_init_worker,
+                initargs=(shared.buffers,))
+    try:
+        return pool.map(worker, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _stack_worker(task):
+    """ Build the offer stack for a contiguous range of periods, returning
+    the row positions in stack order and their cumulative quantities.
+    """
+
+    start, stop, minimum_quantity = task
+    arrays = _shared_arrays(start, stop)
+    tpid = arrays["Trading_Period_ID"]
+    price, quantity = arrays["Price"], arrays["Quantity"]
+
+    keep = np.flatnonzero((quantity >= minimum_quantity) &
+                          (quantity <= 1000000))
+    if not len(keep):
+        return keep, np.array([], dtype=float)
+
+    order = keep[np.lexsort((-quantity[keep], price[keep], tpid[keep]))]
+    return start + order, _period_cumsum(tpid[order], quantity[order])
+
+
+def parallel_offer_stack(frame, processes=None, minimum_quantity=0.001):
+    """ Parallel version of Frame.offer_stack. The Trading_Period_ID,
+    Price and Quantity columns are placed in shared memory and contiguous
+    ranges of periods are stacked by each worker, the parent then takes the
+    stacked rows from the Frame in a single pass.
+
+    Example Usage:
+    --------------
+        parallel_offer_stack(frame, processes=4)
+
+    Returns
+    -------
+    Frame: As Frame.offer_stack, with the Cumulative_Quantity column
+
+    """
+
+    from multiprocessing import cpu_count
+    processes = processes or cpu_count()
+
+    arr = frame if frame._is_period_sorted() else frame.sort_periods()
+    shared = SharedColumns(arr, ["Trading_Period_ID", "Price", "Quantity"])
+
+    tasks = [(start, stop, minimum_quantity) for start, stop in
+             _partition(arr._period_offsets, processes)]
+    results = _run(shared, _stack_worker, tasks, processes)
+
+    # The empty arrays keep an empty or fully filtered Frame working
+    rows = np.concatenate([np.array([], dtype=int)] + [x[0] for x in results])
+    cumulative = np.concatenate([np.array([], dtype=float)] +
+                                [x[1] for x in results])
+    stack = arr.iloc[rows].reset_index(drop=True)
+    stack["Cumulative_Quantity"] = cumulative
+    return stack
+
+
+def _aggregate_worker(task):
+    """ Partial aggregate of a contiguous range of periods """
+
+    start, stop, options = task
+    arr = pd.DataFrame(_shared_arrays(start, stop))
+
+    # Missing labels are encoded as -1, drop them as a groupby drops NaN
+    for col in options["encoded"]:
+        arr = arr[arr[col].values != -1]
+
+    return partial_aggregate(arr, options["by"], options["values"],
+                             weights=options["weights"], bins=options["bins"])
+
+
+def parallel_aggregate(frame, by, values=("Price",), weights="Quantity",
+                       quantiles=None, bins=None, processes=None):
+    """ Aggregate a Frame in parallel, the columns needed are placed in
+    shared memory, object columns as integer codes, and each worker
+    computes the partial aggregate of a contiguous range of periods. The
+    partials are merged and decoded as in aggregate_offers.
+
+    Example Usage:
+    --------------
+        parallel_aggregate(frame, by=["Island_Name", "Trading_Day"],
+                           processes=4)
+
+    Returns
+    -------
+    DataFrame: Indexed by the group keys with a column for each statistic,
+               see aggregate_offers
+
+    """
+
+    from multiprocessing import cpu_count
+    processes = processes or cpu_count()
+
+    if quantiles and bins is None:
+        raise ValueError("Histogram bins must be passed to estimate quantiles")
+
+    by = [by] if isinstance(by, basestring) else list(by)
+    options = {"by": by, "values": list(values), "weights": weights,
+               "bins": bins if quantiles else None}
+
+    columns = set(by) | set(values) | set([weights, "Trading_Period_ID"])
+    columns = [x for x in frame.columns if x in columns]
+    missing = [x for x in by if x not in columns and x not in DERIVED_KEYS]
+    if missing:
+        raise KeyError("Columns not in the Frame: %s" % ", ".join(missing))
+
+    arr = frame if frame._is_period_sorted() else frame.sort_periods()
+    shared = SharedColumns(arr, columns)
+    options["encoded"] = [x for x in by if x in shared.labels]
+
+    tasks = [(start, stop, options) for start, stop in
+             _partition(arr._period_offsets, processes)]
+    state = merge_partials(_run(shared, _aggregate_worker, tasks, processes),
+                           by)
+
+    state = shared.decode(state.reset_index(), by).set_index(by)
+    return _finalise(state, options, quantiles)
+
+
+if __name__ == '__main__':
+    pass
@@ -6,3 +6,5 @@ __email__ = 'nigel.cleland@gmail.com'
 __version__ = '0.1.0'
 
 from Frames import Frame, load_offerframe
+from Aggregate import aggregate_offers
+from Parallel import parallel_aggregate, parallel_offer_stack
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_frames
+----------------------------------
+
+Micro-benchmarks for the `Frame` object, run directly with python.
+
+The filter chain benchmark times a typical efilter/rfilter/nfilter chain
+and counts the copies, constructions and peak bytes allocated, for both
+the previous copy and re-wrap path and the current one.
+"""
+
+import timeit
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from OfferPandas import Frame
+
+
+def synthetic_frame(periods=480, nodes=200, bands=5):
+    """ A stacked energy Frame of periods * nodes * bands offers """
+
+    size = periods * nodes * bands
+    return Frame(pd.DataFrame({
+        "Trading_Period_ID": np.repeat(2013010101 + np.arange(periods),
+                                       nodes * bands),
+        "Node": np.tile(np.repeat(["N%04d" % x for x in range(nodes)], bands),
+                        periods),
+        "Company": np.tile(np.repeat(["C%02d" % (x % 10) for x in
+                                      range(nodes)], bands), periods),
+        "Band": np.tile(np.arange(1, bands + 1), periods * nodes),
+        "Price": np.random.uniform(0, 300, size),
+        "Quantity": np.random.uniform(0, 100, size)}))
+
+
+def filter_chain(frame):
+    arr = frame.efilter(Company="C01")
+    arr = arr.rfilter(Price=(10, 200))
+    arr = arr.nfilter(Band=5)
+    return arr
+
+
+def legacy_filter_chain(frame):
+    """ The same chain following the previous Frame methods, each filter
+    copied the whole Frame up front and wrapped its result in Frame again
+    """
+
+    arr = frame.copy()
+    arr = Frame(arr[arr["Company"] == "C01"])
+    arr = arr.copy()
+    arr = Frame(arr[(arr["Price"] >= 10) & (arr["Price"] <= 200)])
+    arr = arr.copy()
+    arr = Frame(arr[arr["Band"] != 5])
+    return arr
+
+
+def count_allocations(func, *args):
+    """ Count the DataFrame.copy and DataFrame.__init__ calls (which
+    includes Frame construction) made whilst running func, along with the
+    peak bytes allocated where tracemalloc is available.
+    """
+
+    calls = {"copy": 0, "init": 0}
+    original_copy, original_init = DataFrame.copy, DataFrame.__init__
+
+    def counting_copy(self, *cargs, **ckargs):
+        calls["copy"] += 1
+        return original_copy(self, *cargs, **ckargs)
+
+    def counting_init(self, *cargs, **ckargs):
+        calls["init"] += 1
+        return original_init(self, *cargs, **ckargs)
+
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    DataFrame.copy, DataFrame.__init__ = counting_copy, counting_init
+    try:
+        if tracemalloc:
+            tracemalloc.start()
+        func(*args)
+        if tracemalloc:
+            calls["peak"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    finally:
+        DataFrame.copy, DataFrame.__init__ = original_copy, original_init
+    return calls
+
+
+def main():
+    frame = synthetic_frame()
+    print("Filter chain over %s rows" % len(frame))
+    for name, func in (("old", legacy_filter_chain), ("new", filter_chain)):
+        calls = count_allocations(func, frame)
+        seconds = min(timeit.repeat(lambda: func(frame),
+                                    number=10, repeat=3)) / 10
+        peak = ("%.1f MB peak" % (calls["peak"] / 1e6)
+                if "peak" in calls else "peak n/a")
+        print("%s: %.2f ms, %s copies, %s constructions, %s" %
+              (name, seconds * 1000, calls["copy"], calls["init"], peak))
+
+
+if __name__ == '__main__':
+    main()
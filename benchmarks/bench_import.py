@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_import
+----------------------------------
+
+Time a cold `import OfferPandas` in fresh interpreters and check that
+none of the lazily imported dependencies are loaded at import.
+"""
+
+import subprocess
+import sys
+import timeit
+
+# dateutil is not listed as pandas imports it itself
+LAZY_MODULES = ("matplotlib", "simplejson")
+
+CHECK = """
+import sys
+import OfferPandas
+print(",".join(x for x in %r if x in sys.modules))
+""" % (LAZY_MODULES,)
+
+
+def import_time(repeat=5):
+    """ Best wall clock time of a fresh interpreter importing OfferPandas
+    less that of a fresh interpreter importing pandas alone.
+    """
+
+    def run(statement):
+        return min(timeit.repeat(
+            lambda: subprocess.check_call([sys.executable, "-c", statement]),
+            number=1, repeat=repeat))
+
+    return run("import OfferPandas") - run("import pandas")
+
+
+def eager_modules():
+    output = subprocess.check_output([sys.executable, "-c", CHECK])
+    return [x for x in output.decode().strip().split(",") if x]
+
+
+def main():
+    print("import OfferPandas over pandas: %.1f ms" % (import_time() * 1000))
+    eager = eager_modules()
+    if eager:
+        print("Imported at startup: %s" % ", ".join(eager))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,9 +8,33 @@ test_OfferPandas
 Tests for `OfferPandas` module.
 """
 
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
+import warnings
 
-from OfferPandas import OfferPandas
+import numpy as np
+import pandas as pd
+
+from OfferPandas import Frame, load_offerframe
+
+
+def stacked_frame():
+    """ A small stacked Frame with three periods, deliberately unsorted """
+    return Frame(pd.DataFrame({
+        "Trading_Period_ID": [2013010102, 2013010101, 2013010103,
+                              2013010101, 2013010102, 2013010103],
+        "Node": ["HLY2201 HLY1", "HLY2201 HLY1", "HLY2201 HLY1",
+                 "WKM2201 WKM1", "WKM2201 WKM1", "WKM2201 WKM1"],
+        "Company": ["GENE", "GENE", "GENE", "MRPL", "MRPL", "MRPL"],
+        "Product_Type": ["Energy"] * 6,
+        "Reserve_Type": ["Energy"] * 6,
+        "Band": [1] * 6,
+        "Price": [20.0, 10.0, 30.0, 5.0, 25.0, 15.0],
+        "Quantity": [100.0, 50.0, 0.0, 80.0, 60.0, 40.0]}))
 
 
 class TestOfferpandas(unittest.TestCase):
@@ -24,5 +48,465 @@ class TestOfferpandas(unittest.TestCase):
     def tearDown(self):
         pass
 
+
+class TestImport(unittest.TestCase):
+
+    def test_lazy_imports(self):
+        """ Heavy optional dependencies must not load with the package """
+        check = ("import sys, OfferPandas; "
+                 "print([x for x in ('matplotlib', 'simplejson')"
+                 " if x in sys.modules])")
+        output = subprocess.check_output([sys.executable, "-c", check])
+        self.assertEqual(output.decode().strip(), "[]")
+
+
+class TestFrameSubclass(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = stacked_frame()
+
+    def test_slicing(self):
+        self.assertIsInstance(self.frame[self.frame["Band"] == 1], Frame)
+        self.assertIsInstance(self.frame.iloc[1:3], Frame)
+        self.assertIsInstance(self.frame[["Price", "Quantity"]], Frame)
+
+    def test_merge_concat(self):
+        other = pd.DataFrame({"Company": ["GENE"], "Name": ["Genesis"]})
+        self.assertIsInstance(self.frame.merge(other), Frame)
+        self.assertIsInstance(pd.concat([self.frame, self.frame]), Frame)
+
+    def test_groupby(self):
+        grouped = self.frame.groupby("Company")[["Price", "Quantity"]].sum()
+        self.assertIsInstance(grouped, Frame)
+
+    def test_filters_leave_original(self):
+        arr = self.frame.efilter(Company="GENE").rfilter(Price=(0, 25))
+        self.assertIsInstance(arr, Frame)
+        self.assertEqual(len(arr), 2)
+        self.assertEqual(len(self.frame), 6)
+
+
+class TestPeriodSorting(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = stacked_frame().sort_periods()
+
+    def test_sort_periods(self):
+        tpid = self.frame["Trading_Period_ID"].values
+        self.assertTrue((np.diff(tpid) >= 0).all())
+        self.assertEqual(list(self.frame._period_offsets), [0, 2, 4, 6])
+
+    def test_period(self):
+        arr = self.frame.period(2013010102)
+        self.assertEqual(len(arr), 2)
+        self.assertTrue((arr["Trading_Period_ID"] == 2013010102).all())
+        self.assertEqual(len(self.frame.period(2013010105)), 0)
+
+    def test_periods(self):
+        arr = self.frame.periods(2013010102, 2013010103)
+        self.assertEqual(len(arr), 4)
+        self.assertEqual(len(arr.period(2013010103)), 2)
+
+    def test_stale_offsets(self):
+        self.assertTrue(self.frame._is_period_sorted())
+        self.frame.sort(columns="Price", inplace=True)
+        self.assertFalse(self.frame._is_period_sorted())
+        self.assertEqual(len(self.frame.period(2013010102)), 2)
+
+    def test_reassigned_periods(self):
+        self.frame["Trading_Period_ID"] = self.frame["Trading_Period_ID"] + 1
+        self.assertFalse(self.frame._is_period_sorted())
+        self.assertEqual(len(self.frame.period(2013010104)), 2)
+
+    def test_offer_stack(self):
+        arr = stacked_frame().offer_stack()
+        first = arr[arr["Trading_Period_ID"] == 2013010101]
+        self.assertEqual(list(first["Cumulative_Quantity"]), [80.0, 130.0])
+        self.assertEqual(len(arr), 5)
+
+
+class TestMapLocations(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = Frame(pd.DataFrame({
+            "Node": ["HLY2201 HLY1", "XXX0001 XXX1", "HLY2201 HLY1"],
+            "Bus_Id": ["HLY2201", "XXX0001", "HLY2201"],
+            "Band1_Price": [10.0, 20.0, 30.0]}))
+
+    def test_map_locations(self):
+        arr = self.frame._map_locations()
+        self.assertEqual(len(arr), 3)
+        self.assertEqual(arr["Island_Name"][0], "North Island")
+        self.assertTrue(pd.isnull(arr["Island_Name"][1]))
+
+    def test_drop_unmatched(self):
+        arr = self.frame._map_locations(drop_unmatched=True)
+        self.assertEqual(len(arr), 2)
+
+    def test_unmatched_nodes(self):
+        missing = self.frame.unmatched_nodes()
+        self.assertEqual(list(missing["Node"]), ["XXX0001 XXX1"])
+
+    def test_missing_node_is_unmatched(self):
+        """ A missing Node or Bus_Id must not decode to a real pair """
+        from OfferPandas.Frames import _load_node_metadata
+        frame = Frame(pd.DataFrame({
+            "Node": ["HLY2201 HLY1", np.nan, "HLY2201 HLY1"],
+            "Bus_Id": ["HLY2201", "HLY2201", np.nan]}))
+        map_data = _load_node_metadata()
+        self.assertEqual(list(frame._node_metadata_rows(map_data) == -1),
+                         [False, True, True])
+
+
+class TestValidate(unittest.TestCase):
+
+    def test_validate(self):
+        frame = stacked_frame()
+        frame["Trading_Period"] = [2, 1, 3, 1, 2, 51]
+        frame["Band"] = [1, 1, 1, 1, 2, 2]
+        frame["Quantity"] = [100.0, -1.0, 0.0, 80.0, 60.0, 40.0]
+        frame["Price"] = [20.0, 10.0, 30.0, 25.0, 5.0, 15.0]
+        frame = frame.append(frame.iloc[[0]], ignore_index=True)
+
+        clean, quarantine, report = frame.validate()
+        report = report.set_index("Check")["Rows"]
+
+        self.assertEqual(report["Trading_Period outside 1-50"], 1)
+        self.assertEqual(report["Missing or negative Quantity"], 1)
+        self.assertEqual(report["Duplicate offer key"], 1)
+        self.assertEqual(report["Missing Price"], 0)
+        self.assertEqual(len(clean) + len(quarantine), len(frame))
+        self.assertEqual(list(clean.index), [0, 2, 3, 4])
+        self.assertEqual(quarantine["Issue"][1],
+                         "Missing or negative Quantity")
+
+    def test_skipped_checks(self):
+        clean, quarantine, report = stacked_frame().validate()
+        report = report.set_index("Check")["Rows"]
+        self.assertTrue(pd.isnull(report["Missing or invalid Trading_Date"]))
+        self.assertTrue(pd.isnull(report["Node missing from metadata"]))
+
+    def test_decreasing_band_prices(self):
+        frame = stacked_frame()
+        frame["Trading_Period_ID"] = 2013010101
+        frame["Band"] = [1, 2, 3, 1, 2, 3]
+        frame["Price"] = [10.0, 20.0, 15.0, 5.0, 5.0, 50.0]
+        frame["Quantity"] = 10.0
+        self.assertEqual(list(frame._decreasing_band_prices()),
+                         [False, False, True, False, False, False])
+
+    def test_empty_trailing_bands(self):
+        """ Unused bands of 0 MW at $0 are not decreasing prices """
+        frame = stacked_frame()
+        frame["Trading_Period_ID"] = 2013010101
+        frame["Band"] = [1, 2, 3, 1, 2, 3]
+        frame["Price"] = [10.0, 20.0, 0.0, 5.0, 0.0, 0.0]
+        frame["Quantity"] = [50.0, 20.0, 0.0, 80.0, 0.0, 0.0]
+        self.assertFalse(frame._decreasing_band_prices().any())
+
+    def test_il_providers_at_same_node(self):
+        """ IL offers use the Bus_Id as the Node, the Company separates
+        two providers offering at the same Grid Exit Point
+        """
+        frame = stacked_frame()
+        frame["Trading_Period_ID"] = 2013010101
+        frame["Node"] = "HLY2201"
+        frame["Band"] = [1, 2, 3, 1, 2, 3]
+        frame["Price"] = [10.0, 20.0, 30.0, 5.0, 6.0, 7.0]
+        frame["Quantity"] = 10.0
+
+        clean, quarantine, report = frame.validate()
+        self.assertEqual(len(quarantine), 0)
+
+    def test_load_bad_period_and_date(self):
+        """ Missing periods and dates are quarantined rather than failing
+        the load when the identifier is created
+        """
+        offer = ["GENE", "HLY2201", "HLY", "1", "1/01/2013", "1", "250",
+                 "5", "5", "100", "10", "50", "20", "0", "0", "0", "0",
+                 "0", "0", "1/01/2013", "1/01/2013"]
+        no_period, no_date = list(offer), list(offer)
+        no_period[5], no_date[4] = "", ""
+
+        directory = tempfile.mkdtemp()
+        fName = os.path.join(directory, "offers.csv")
+        try:
+            with open(fName, "w") as f:
+                for row in (offer, no_period, no_date):
+                    f.write(",".join(row) + "\n")
+
+            frame = load_offerframe(fName)
+        finally:
+            shutil.rmtree(directory)
+
+        report = frame.quality_report.set_index("Check")["Rows"]
+        self.assertEqual(report["Trading_Period outside 1-50"], 1)
+        self.assertEqual(report["Missing or invalid Trading_Date"], 1)
+        self.assertEqual(report["Band Price decreasing"], 0)
+        self.assertEqual(len(frame), 5)
+        self.assertEqual(list(frame["Trading_Period_ID"].unique()),
+                         [2013010101])
+        self.assertEqual(len(frame.quarantine), 10)
+
+
+class TestColumnProjection(unittest.TestCase):
+
+    def test_projected_columns(self):
+        from OfferPandas.Frames import _projected_columns
+        names = ["Company", "Grid_Injection_Point", "Station", "Unit",
+                 "Trading_Date", "Trading_Period", "Max_Output",
+                 "Band1_Power", "Band1_Price", "Created_Date"]
+
+        usecols = _projected_columns(names, ["Trading_Period_ID", "Company",
+                                             "Quantity"])
+        self.assertEqual([names[x] for x in usecols],
+                         ["Company", "Trading_Date", "Trading_Period",
+                          "Band1_Power"])
+
+        usecols = _projected_columns(names, ["Island_Name", "Price"])
+        self.assertEqual([names[x] for x in usecols],
+                         ["Grid_Injection_Point", "Station", "Unit",
+                          "Band1_Price"])
+
+    offer = ["GENE", "HLY2201", "HLY", "1", "1/01/2013", "1", "250",
+             "5", "5", "100", "10", "50", "20", "0", "0", "0", "0",
+             "0", "0", "1/01/2013", "1/01/2013"]
+
+    def load(self, rows, columns):
+        directory = tempfile.mkdtemp()
+        fName = os.path.join(directory, "offers.csv")
+        try:
+            with open(fName, "w") as f:
+                for row in rows:
+                    f.write(",".join(row) + "\n")
+            return load_offerframe(fName, columns=columns)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_projected_load_is_validated(self):
+        bad_period = list(self.offer)
+        bad_period[5] = "60"
+        frame = self.load([self.offer, bad_period],
+                          ["Trading_Period_ID", "Price", "Quantity"])
+
+        report = frame.quality_report.set_index("Check")["Rows"]
+        self.assertEqual(report["Trading_Period outside 1-50"], 1)
+        self.assertFalse(report.isnull().any())
+        self.assertEqual(sorted(frame.columns),
+                         ["Band", "Price", "Product_Type", "Quantity",
+                          "Reserve_Type", "Trading_Period_ID"])
+        self.assertEqual(len(frame), 5)
+
+    def test_projected_bands_not_warned(self):
+        """ Band checks on parameters left out of the projection are only
+        reported, not warned about on every load
+        """
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            frame = self.load([self.offer], ["Trading_Period_ID", "Price"])
+
+        report = frame.quality_report.set_index("Check")["Rows"]
+        self.assertTrue(pd.isnull(report["Missing or negative Quantity"]))
+        self.assertFalse([x for x in caught
+                          if "Checks skipped" in str(x.message)])
+        self.assertNotIn("Bus_Id", frame.columns)
+
+
+class TestOfferChanges(unittest.TestCase):
+
+    def test_period_changes(self):
+        frame = stacked_frame()
+        frame["Price"] = [10.0, 10.0, 30.0, 5.0, 5.0, 15.0]
+        changes = frame.offer_changes()
+
+        self.assertEqual(len(changes), 4)
+        gene = changes[changes["Node"] == "HLY2201 HLY1"]
+        self.assertEqual(list(gene["Trading_Period_ID"]),
+                         [2013010102, 2013010103])
+        self.assertEqual(list(gene["Previous_Trading_Period_ID"]),
+                         [2013010101, 2013010102])
+        self.assertEqual(list(gene["Quantity_Change"]), [50.0, -100.0])
+
+    def test_amended_changes(self):
+        initial = stacked_frame()
+        amended = stacked_frame()
+        amended["Price"] = [20.0, 10.0, 30.0, 5.0, 35.0, 15.0]
+        changes = initial.offer_changes(amended)
+
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes["Trading_Period_ID"][0], 2013010102)
+        self.assertEqual(changes["Previous_Price"][0], 25.0)
+        self.assertEqual(changes["Price_Change"][0], 10.0)
+
+    def test_duplicate_key_is_not_amendment(self):
+        initial = stacked_frame()
+        duplicated = initial.append(initial.iloc[[0]], ignore_index=True)
+        duplicated["Price"] = [20.0, 10.0, 30.0, 5.0, 25.0, 15.0, 99.0]
+        self.assertEqual(len(initial.offer_changes(initial)), 0)
+        changes = duplicated.offer_changes(initial)
+        self.assertEqual(list(changes["Previous_Price"]), [99.0])
+
+    def test_duplicate_key_is_not_period_change(self):
+        frame = stacked_frame()
+        frame = frame.append(frame.iloc[[1]], ignore_index=True)
+        frame["Price"] = [20.0, 10.0, 30.0, 5.0, 25.0, 15.0, 99.0]
+        changes = frame.offer_changes(parameters=("Price",))
+        gene = changes[changes["Node"] == "HLY2201 HLY1"]
+        self.assertEqual(list(gene["Previous_Trading_Period_ID"]),
+                         [2013010101, 2013010102])
+
+    def test_il_providers_at_same_node(self):
+        """ IL offers use the Bus_Id as the Node, the Company separates
+        two providers offering at the same Grid Exit Point
+        """
+        frame = stacked_frame()
+        frame["Node"] = "HLY2201"
+        frame["Price"] = [10.0, 10.0, 10.0, 5.0, 5.0, 5.0]
+        frame["Quantity"] = 10.0
+        self.assertEqual(len(frame.offer_changes()), 0)
+
+
+class TestSupplyCurves(unittest.TestCase):
+
+    def test_quantity_axis(self):
+        tpids, curves = stacked_frame().supply_curves([0, 80, 100, 200])
+        self.assertEqual(list(tpids), [2013010101, 2013010102, 2013010103])
+        np.testing.assert_array_equal(curves[0], [5.0, 5.0, 10.0, np.nan])
+        np.testing.assert_array_equal(curves[2],
+                                      [15.0, np.nan, np.nan, np.nan])
+
+    def test_price_axis(self):
+        tpids, curves = stacked_frame().supply_curves([0, 5, 10, 50],
+                                                      axis="price")
+        np.testing.assert_array_equal(curves[0], [0.0, 80.0, 130.0, 130.0])
+        np.testing.assert_array_equal(curves[2], [0.0, 0.0, 0.0, 40.0])
+
+    def test_split(self):
+        tpids, curves = stacked_frame().supply_curves([0, 50], axis="price",
+                                                      split="Company")
+        self.assertEqual(sorted(curves), ["GENE", "MRPL"])
+        np.testing.assert_array_equal(curves["GENE"][:, 1],
+                                      [50.0, 100.0, 0.0])
+
+    def test_missing_split(self):
+        frame = stacked_frame()
+        frame["Island_Name"] = ["North Island"] * 5 + [np.nan]
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            tpids, curves = frame.supply_curves([0, 50], axis="price",
+                                                split="Island_Name")
+
+        self.assertEqual(list(curves), ["North Island"])
+        self.assertTrue([x for x in caught
+                         if "1 rows with a missing Island_Name" in
+                         str(x.message)])
+
+    def test_cache(self):
+        cache_dir = os.path.join(tempfile.mkdtemp(), "curves")
+        try:
+            frame = stacked_frame()
+            for i in range(2):
+                tpids, curves = frame.supply_curves(
+                    [0, 50], axis="price", split="Band", cache_dir=cache_dir)
+                self.assertEqual(list(curves), [1])
+                np.testing.assert_array_equal(curves[1][:, 1],
+                                              [130.0, 160.0, 40.0])
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+        finally:
+            shutil.rmtree(os.path.dirname(cache_dir))
+
+
+class TestCompetitionMetrics(unittest.TestCase):
+
+    def test_residual_supply_index(self):
+        demand = {2013010101: 100.0, 2013010102: 50.0, 2013010103: 30.0}
+        metrics = stacked_frame().competition_metrics(demand)
+        metrics = metrics.set_index(["Trading_Period_ID", "Company"])
+
+        first = metrics.loc[(2013010101, "GENE")]
+        self.assertEqual(first["Total_Capacity"], 130.0)
+        self.assertAlmostEqual(first["Residual_Supply_Index"], 0.8)
+        self.assertTrue(first["Pivotal"])
+
+        # The zero quantity GENE offer is excluded, MRPL alone remains
+        self.assertNotIn((2013010103, "GENE"), metrics.index)
+        self.assertFalse(metrics.loc[(2013010102, "MRPL")]["Pivotal"])
+
+    def test_missing_demand(self):
+        demand = {2013010101: 100.0}
+        metrics = stacked_frame().competition_metrics(demand)
+        missing = metrics[metrics["Trading_Period_ID"] != 2013010101]
+        self.assertTrue(missing["Pivotal"].isnull().all())
+        self.assertTrue(missing["Residual_Supply_Index"].isnull().all())
+
+    def test_price_cap(self):
+        demand = {2013010101: 50.0, 2013010102: 50.0, 2013010103: 50.0}
+        metrics = stacked_frame().competition_metrics(demand, price_cap=15.0)
+        self.assertEqual(len(metrics), 3)
+
+    def test_multiple_products(self):
+        frame = stacked_frame()
+        frame["Product_Type"] = ["Energy"] * 3 + ["PLSR"] * 3
+        self.assertRaises(ValueError, frame.competition_metrics, {})
+
+
+class TestAggregate(unittest.TestCase):
+
+    def test_merge_partials(self):
+        from OfferPandas.Aggregate import (partial_aggregate, merge_partials,
+                                           _finalise)
+        frame = stacked_frame()
+        by = ["Company"]
+        options = {"values": ["Price"], "weights": "Quantity",
+                   "bins": [0, 10, 20, 30, 40]}
+        partials = [partial_aggregate(frame.period(tpid), by, ["Price"],
+                                      bins=options["bins"])
+                    for tpid in (2013010101, 2013010102, 2013010103)]
+        result = _finalise(merge_partials(partials, by), options, (0.5,))
+
+        self.assertEqual(result["Price_count"]["GENE"], 3)
+        self.assertEqual(result["Price_max"]["MRPL"], 25.0)
+        self.assertAlmostEqual(result["Price_mean"]["GENE"], 20.0)
+        self.assertAlmostEqual(result["Price_weighted_mean"]["GENE"],
+                               2500.0 / 150.0)
+        self.assertEqual(result["Price_q50"]["GENE"], 25.0)
+
+
+class TestParallel(unittest.TestCase):
+
+    def test_parallel_offer_stack(self):
+        frame = stacked_frame()
+        serial = frame.offer_stack()
+        parallel = frame.offer_stack(processes=2)
+        self.assertEqual(list(parallel["Cumulative_Quantity"]),
+                         list(serial["Cumulative_Quantity"]))
+        self.assertEqual(list(parallel["Price"]), list(serial["Price"]))
+
+    def test_parallel_offer_stack_empty(self):
+        frame = stacked_frame()
+        frame["Quantity"] = 0.0
+        stack = frame.offer_stack(processes=2)
+        self.assertEqual(len(stack), 0)
+        self.assertIn("Cumulative_Quantity", stack.columns)
+
+    def test_parallel_aggregate_missing_keys(self):
+        from OfferPandas import parallel_aggregate
+        from OfferPandas.Aggregate import partial_aggregate
+        frame = stacked_frame()
+        frame["Company"] = ["GENE", None, "GENE", "MRPL", "MRPL", "MRPL"]
+
+        result = parallel_aggregate(frame, by="Company", processes=2)
+        serial = partial_aggregate(frame, ["Company"], ["Price"])
+        self.assertEqual(sorted(result.index), sorted(serial.index))
+        self.assertEqual(result["Price_count"]["GENE"], 2)
+
+    def test_parallel_aggregate(self):
+        from OfferPandas import parallel_aggregate
+        result = parallel_aggregate(stacked_frame(), by="Company",
+                                    processes=2)
+        self.assertEqual(result["Price_count"]["MRPL"], 3)
+        self.assertAlmostEqual(result["Price_mean"]["GENE"], 20.0)
+
+
 if __name__ == '__main__':
     unittest.main()